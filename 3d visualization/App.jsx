@@ -27,6 +27,7 @@ const SeismicViewer = () => {
   const plotDiv = useRef(null);
 
   const API_BASE_URL = 'http://localhost:5000/api';
+  const MAX_SLICE_DIM = 800;
 
   const colorSchemes = {
     seismic: [
@@ -133,11 +134,12 @@ const SeismicViewer = () => {
         method: 'POST',
         body: formData,
       });
-      const result = await response.json();
-      console.log('Upload response:', result);
+      const upload = await response.json();
+      console.log('Upload response:', upload);
       if (!response.ok) {
-        throw new Error(result.error || 'Upload failed');
+        throw new Error(upload.error || 'Upload failed');
       }
+      const result = await waitForJob(upload.job_id);
       setCubeInfo(result.cube_info);
       setCubeId(result.cube_id);
       setSessionId(result.session_id);
@@ -158,12 +160,30 @@ const SeismicViewer = () => {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    console.log(`Waiting for upload job ${jobId}...`);
+    while (true) {
+      const response = await fetch(`${API_BASE_URL}/job/${jobId}`);
+      const job = await response.json();
+      if (!response.ok) {
+        throw new Error(job.error || 'Failed to get upload job status');
+      }
+      if (job.status === 'finished') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Upload failed');
+      }
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   const loadSliceData = async (indices) => {
     const newSliceData = {};
     try {
       for (const sliceType of ['inline', 'xline', 'sample']) {
         console.log(`Loading ${sliceType} slice at index ${indices[sliceType]}`);
-        const response = await fetch(`${API_BASE_URL}/slice/${sliceType}/${indices[sliceType]}`);
+        const response = await fetch(`${API_BASE_URL}/slice/${sliceType}/${indices[sliceType]}?max_dim=${MAX_SLICE_DIM}`);
         if (response.ok) {
           const data = await response.json();
           newSliceData[sliceType] = data;
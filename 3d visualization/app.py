@@ -1,7 +1,9 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 import numpy as np
+import orjson
+from numba import njit, prange
 import segyio
 import warnings
 import zipfile
@@ -13,6 +15,9 @@ from bson import ObjectId
 from datetime import datetime
 from dotenv import load_dotenv
 import traceback
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 warnings.filterwarnings('ignore')
 
@@ -25,12 +30,40 @@ CORS(app)
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'segy', 'sgy', 'zip'}
+CUBE_LIST_PROJECTION = {'filename': 1, 'session_id': 1, 'created_at': 1, 'updated_at': 1}
+PERCENTILE_SAMPLE_SIZE = 1_000_000
+ZIP_COPY_BUFFER_SIZE = 4 * 1024 * 1024
+JOB_RETENTION_SECONDS = 60 * 60
+
+# Big-endian int32 trace header words read for every trace, keyed by name
+TRACE_HEADER_FIELDS = {
+    'inline': segyio.TraceField.INLINE_3D,
+    'xline': segyio.TraceField.CROSSLINE_3D,
+    'cdp_x': segyio.TraceField.CDP_X,
+    'cdp_y': segyio.TraceField.CDP_Y,
+    'source_x': segyio.TraceField.SourceX,
+    'source_y': segyio.TraceField.SourceY
+}
+SLICE_CACHE_SIZE = int(os.getenv('SLICE_CACHE_SIZE', 128))
+
+# Keep extra transposed copies of the cube so xline/sample slices are contiguous reads.
+# Each copy costs as much memory as the cube itself; disable on memory-constrained hosts.
+# Never built for cubes memory-mapped from the store, since that would read the whole file into RAM.
+CACHE_SLICE_LAYOUTS = os.getenv('CACHE_SLICE_LAYOUTS', 'true').lower() == 'true'
+SLICE_LAYOUT_AXES = {
+    'xline': (1, 2, 0),   # (xline, sample, inline)
+    'sample': (2, 0, 1)   # (sample, inline, xline)
+}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024 
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Raw .npy copies of processed cubes, memory-mapped on reload instead of re-parsing the SEGY
+CUBE_STORE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cubes')
+os.makedirs(CUBE_STORE_FOLDER, exist_ok=True)
+
 # MongoDB Configuration
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'seismic_viewer')
@@ -60,7 +93,7 @@ try:
     sessions_collection = db['sessions']
     
     # Create indexes for better query performance
-    cubes_collection.create_index([("session_id", 1)])
+    cubes_collection.create_index([("session_id", 1), ("created_at", -1)])
     cubes_collection.create_index([("created_at", -1)])
     
     # Test write operation
@@ -78,6 +111,99 @@ except Exception as e:
     traceback.print_exc()
     print("  The application will run but data won't persist to MongoDB")
 
+@njit(parallel=True, fastmath=True, cache=True)
+def compute_amplitude_stats(data):
+    """Compute min, max, mean and std of a 3D cube in a single parallel pass"""
+    n_inlines = data.shape[0]
+    mins = np.empty(n_inlines)
+    maxs = np.empty(n_inlines)
+    sums = np.zeros(n_inlines)
+    sumsqs = np.zeros(n_inlines)
+
+    # Accumulate around the first sample so sum of squares doesn't cancel out
+    shift = np.float64(data[0, 0, 0])
+
+    for i in prange(n_inlines):
+        lo = np.float64(data[i, 0, 0])
+        hi = lo
+        s = 0.0
+        ss = 0.0
+        for j in range(data.shape[1]):
+            for k in range(data.shape[2]):
+                v = np.float64(data[i, j, k])
+                if v < lo:
+                    lo = v
+                if v > hi:
+                    hi = v
+                d = v - shift
+                s += d
+                ss += d * d
+        mins[i] = lo
+        maxs[i] = hi
+        sums[i] = s
+        sumsqs[i] = ss
+
+    n = data.size
+    mean_shifted = sums.sum() / n
+    variance = max(sumsqs.sum() / n - mean_shifted * mean_shifted, 0.0)
+    return mins.min(), maxs.max(), shift + mean_shifted, np.sqrt(variance)
+
+@njit(fastmath=True, cache=True)
+def compute_slice_stats(data):
+    """Compute min, max, mean and std of a 2D slice in a single serial pass"""
+    shift = np.float64(data[0, 0])
+    lo = shift
+    hi = shift
+    s = 0.0
+    ss = 0.0
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            v = np.float64(data[i, j])
+            if v < lo:
+                lo = v
+            if v > hi:
+                hi = v
+            d = v - shift
+            s += d
+            ss += d * d
+
+    n = data.size
+    mean_shifted = s / n
+    variance = max(ss / n - mean_shifted * mean_shifted, 0.0)
+    return lo, hi, shift + mean_shifted, np.sqrt(variance)
+
+# No fastmath here: it would let the compiler assume samples are finite and drop the isfinite check
+@njit(parallel=True, cache=True)
+def scatter_traces(traces, trace_ids, inline_idx, xline_idx, out):
+    """Write the selected traces into their (inline, xline) cells of the cube, replacing NaN/inf samples with zero
+
+    trace_ids must not contain two traces for the same cell, otherwise threads race on it.
+    """
+    for n in prange(trace_ids.shape[0]):
+        t = trace_ids[n]
+        i = inline_idx[t]
+        j = xline_idx[t]
+        for k in range(traces.shape[1]):
+            v = traces[t, k]
+            out[i, j, k] = v if np.isfinite(v) else 0.0
+
+# Numba's fallback workqueue threading layer aborts the process if two threads launch parallel kernels
+# at once, so every parallel kernel call goes through this lock
+parallel_kernel_lock = threading.Lock()
+
+def block_mean_downsample(data, max_dim):
+    """Average a 2D slice over blocks so neither side exceeds max_dim, returning the row and column strides"""
+    row_stride = -(-data.shape[0] // max_dim)
+    col_stride = -(-data.shape[1] // max_dim)
+    if row_stride == 1 and col_stride == 1:
+        return data, 1, 1
+    
+    # Trailing rows/columns that don't fill a whole block are dropped
+    n_rows = data.shape[0] // row_stride
+    n_cols = data.shape[1] // col_stride
+    blocks = data[:n_rows * row_stride, :n_cols * col_stride].reshape(n_rows, row_stride, n_cols, col_stride)
+    return blocks.mean(axis=(1, 3), dtype=np.float32), row_stride, col_stride
+
 class SeismicCubeProcessor:
     def __init__(self):
         self.data = None
@@ -93,120 +219,98 @@ class SeismicCubeProcessor:
         self.sample_coords = None
         self.session_id = None
         self.cube_id = None
+        self.geometry = {
+            'inline_azimuth': 0.0,
+            'xline_azimuth': 90.0,
+            'has_coordinates': False
+        }
+        self.slice_layouts = {}
+        self.generation = 0
+        # Guards the cube state above: a load swaps it all at once while request threads read it
+        self.lock = threading.RLock()
         
-    def load_segy_file(self, filepath):
+    def load_segy_file(self, filepath, session_id=None):
         try:
             print(f"\n{'='*60}")
             print(f"Loading SEGY file: {filepath}")
             print(f"{'='*60}")
             
+            # Everything is built in locals and published in one step at the end, since request
+            # threads keep serving the current cube while this runs
             with segyio.open(filepath, ignore_geometry=True) as f:
+                # Memory-map the file so header and trace reads come straight from the page cache
+                if not f.mmap():
+                    print("  Warning: Could not memory-map SEGY file, falling back to buffered reads")
                 n_traces = len(f.trace)
                 n_samples = len(f.samples)
                 
                 print(f"Total traces: {n_traces:,}")
                 print(f"Samples per trace: {n_samples:,}")
                 
-                self.sample_coords = np.array(f.samples)
-                
-                inlines = []
-                xlines = []
-                x_coords = []
-                y_coords = []
+                sample_coords = np.array(f.samples)
                 
                 print("Reading trace headers...")
-                for i in range(n_traces):
-                    try:
-                        header = f.header[i]
-                        inline = header[segyio.TraceField.INLINE_3D]
-                        xline = header[segyio.TraceField.CROSSLINE_3D]
-                        
-                        # Get X and Y coordinates for survey geometry
-                        try:
-                            x_coord = header[segyio.TraceField.CDP_X]
-                            y_coord = header[segyio.TraceField.CDP_Y]
-                            # Some files use SourceX/SourceY instead
-                            if x_coord == 0 and y_coord == 0:
-                                x_coord = header[segyio.TraceField.SourceX]
-                                y_coord = header[segyio.TraceField.SourceY]
-                        except:
-                            x_coord = 0
-                            y_coord = 0
-                        
-                        if inline != 0 and xline != 0:
-                            inlines.append(inline)
-                            xlines.append(xline)
-                            x_coords.append(x_coord)
-                            y_coords.append(y_coord)
-                        else:
-                            grid_size = int(np.sqrt(n_traces))
-                            inlines.append(i // grid_size + 1)
-                            xlines.append(i % grid_size + 1)
-                            x_coords.append(0)
-                            y_coords.append(0)
-                            
-                    except Exception:
-                        grid_size = int(np.sqrt(n_traces))
-                        inlines.append(i // grid_size + 1)
-                        xlines.append(i % grid_size + 1)
-                        x_coords.append(0)
-                        y_coords.append(0)
-                
-                unique_inlines = sorted(list(set(inlines)))
-                unique_xlines = sorted(list(set(xlines)))
-                
-                print(f"INLINE range: {min(unique_inlines)} - {max(unique_inlines)} ({len(unique_inlines)} lines)")
-                print(f"XLINE range: {min(unique_xlines)} - {max(unique_xlines)} ({len(unique_xlines)} lines)")
+                headers = self.read_trace_headers(filepath, f)
+                inlines = headers['inline']
+                xlines = headers['xline']
+                x_coords = headers['cdp_x']
+                y_coords = headers['cdp_y']
+
+                # Some files use SourceX/SourceY instead
+                no_cdp = (x_coords == 0) & (y_coords == 0)
+                if no_cdp.any():
+                    x_coords = np.where(no_cdp, headers['source_x'], x_coords)
+                    y_coords = np.where(no_cdp, headers['source_y'], y_coords)
+
+                # Traces without inline/xline numbers are laid out on a square grid
+                missing = (inlines == 0) | (xlines == 0)
+                if missing.any():
+                    grid_size = int(np.sqrt(n_traces))
+                    trace_idx = np.arange(n_traces)[missing]
+                    inlines[missing] = trace_idx // grid_size + 1
+                    xlines[missing] = trace_idx % grid_size + 1
+                    x_coords[missing] = 0
+                    y_coords[missing] = 0
+
+                unique_inlines, inline_idx = np.unique(inlines, return_inverse=True)
+                unique_xlines, xline_idx = np.unique(xlines, return_inverse=True)
                 
-                self.inline_coords = np.array(unique_inlines)
-                self.xline_coords = np.array(unique_xlines)
+                print(f"INLINE range: {unique_inlines[0]} - {unique_inlines[-1]} ({len(unique_inlines)} lines)")
+                print(f"XLINE range: {unique_xlines[0]} - {unique_xlines[-1]} ({len(unique_xlines)} lines)")
                 
                 # Calculate survey geometry
                 geometry_info = self.calculate_survey_geometry(inlines, xlines, x_coords, y_coords, unique_inlines, unique_xlines)
                 
                 print("Building 3D data cube...")
-                self.data = np.zeros((len(unique_inlines), len(unique_xlines), n_samples))
-                
-                inline_map = {il: idx for idx, il in enumerate(unique_inlines)}
-                xline_map = {xl: idx for idx, xl in enumerate(unique_xlines)}
-                
-                for i in range(min(n_traces, len(inlines))):
-                    try:
-                        inline = inlines[i]
-                        xline = xlines[i]
-                        
-                        if inline in inline_map and xline in xline_map:
-                            inline_idx = inline_map[inline]
-                            xline_idx = xline_map[xline]
-                            
-                            trace_data = np.array(f.trace[i])
-                            trace_data = np.nan_to_num(trace_data, nan=0.0, posinf=0.0, neginf=0.0)
-                            
-                            self.data[inline_idx, xline_idx, :] = trace_data
-                            
-                    except Exception:
-                        continue
+                data = self.read_regular_cube(filepath, unique_inlines, unique_xlines)
                 
-                self.inline_range = np.array(unique_inlines)
-                self.xline_range = np.array(unique_xlines)
-                self.sample_range = self.sample_coords
-                self.geometry = geometry_info
+                if data is None:
+                    data = np.zeros((len(unique_inlines), len(unique_xlines), n_samples), dtype=np.float32)
+
+                    # Several traces can share a cell (multiple offsets, merged surveys, grid fallback);
+                    # keep only the last one per cell like a sequential write would, so the parallel scatter can't race
+                    cells = inline_idx * len(unique_xlines) + xline_idx
+                    _, last_from_end = np.unique(cells[::-1], return_index=True)
+                    trace_ids = len(cells) - 1 - last_from_end
+
+                    # Read every trace in one pass and scatter them into the cube in parallel
+                    traces = f.trace.raw[:]
+                    with parallel_kernel_lock:
+                        scatter_traces(traces, trace_ids, inline_idx, xline_idx, data)
                 
                 print("Calculating amplitude statistics...")
                 
-                clean_data = np.nan_to_num(self.data, nan=0.0, posinf=0.0, neginf=0.0)
-                
-                data_min = float(np.min(clean_data))
-                data_max = float(np.max(clean_data))
-                data_mean = float(np.mean(clean_data))
-                data_std = float(np.std(clean_data))
+                with parallel_kernel_lock:
+                    cube_stats = compute_amplitude_stats(data)
+                data_min, data_max, data_mean, data_std = (float(v) for v in cube_stats)
                 
-                p1 = float(np.percentile(clean_data, 1))
-                p99 = float(np.percentile(clean_data, 99))
-                p5 = float(np.percentile(clean_data, 5))
-                p95 = float(np.percentile(clean_data, 95))
+                # Display percentiles from a fixed-seed random sample instead of sorting the whole cube
+                sample = data.ravel()
+                if sample.size > PERCENTILE_SAMPLE_SIZE:
+                    sample = sample[np.random.default_rng(0).integers(0, sample.size, size=PERCENTILE_SAMPLE_SIZE)]
+                p1, p5, p95, p99 = (float(p) for p in np.percentile(sample, [1, 5, 95, 99]))
                 
-                self.amplitude_range = {
+                amplitude_range = {
                     'actual_min': data_min,
                     'actual_max': data_max,
                     'display_min': p5,
@@ -219,16 +323,15 @@ class SeismicCubeProcessor:
                     'p95': p95
                 }
                 
-                self.current_inline_idx = len(self.inline_range) // 2
-                self.current_xline_idx = len(self.xline_range) // 2 
-                self.current_sample_idx = len(self.sample_range) // 2
+                self.publish_cube(data, unique_inlines, unique_xlines, sample_coords,
+                                  amplitude_range, geometry_info, session_id)
                 
                 print("✓ SEGY file loaded successfully!")
-                print(f"  Data shape: {self.data.shape}")
+                print(f"  Data shape: {data.shape}")
                 print(f"  Actual amplitude range: {data_min:.6f} to {data_max:.6f}")
                 print(f"  Display amplitude range (p5-p95): {p5:.6f} to {p95:.6f}")
                 print(f"  Mean: {data_mean:.6f}, Std: {data_std:.6f}")
-                print(f"  Memory usage: {self.data.nbytes / (1024**2):.1f} MB")
+                print(f"  Memory usage: {data.nbytes / (1024**2):.1f} MB")
                 if geometry_info:
                     print(f"  Survey orientation: {geometry_info.get('inline_azimuth', 0):.1f}° from North")
                 print(f"{'='*60}\n")
@@ -240,18 +343,100 @@ class SeismicCubeProcessor:
             traceback.print_exc()
             return False
     
+    def publish_cube(self, data, inline_coords, xline_coords, sample_coords, amplitude_range, geometry,
+                     session_id, cube_id=None):
+        """Swap in a newly loaded cube, replacing all of the previous cube's state at once"""
+        with self.lock:
+            self.data = data
+            self.inline_coords = inline_coords
+            self.xline_coords = xline_coords
+            self.sample_coords = sample_coords
+            self.inline_range = inline_coords
+            self.xline_range = xline_coords
+            self.sample_range = sample_coords
+            self.amplitude_range = amplitude_range
+            self.geometry = geometry
+            self.session_id = session_id
+            self.cube_id = cube_id
+            self.slice_layouts = {}
+            self.generation += 1
+            
+            self.current_inline_idx = len(inline_coords) // 2
+            self.current_xline_idx = len(xline_coords) // 2
+            self.current_sample_idx = len(sample_coords) // 2
+    
+    def read_trace_headers(self, filepath, f):
+        """Read the trace header words used for cube assembly and geometry for every trace"""
+        try:
+            # Fixed-length traces let one strided structured view pick the words out of every header
+            data_offset = 3600 + f.ext_headers * 3200
+            trace_size, remainder = divmod(os.path.getsize(filepath) - data_offset, f.tracecount)
+            if remainder == 0 and trace_size >= 240:
+                header_dtype = np.dtype({
+                    'names': list(TRACE_HEADER_FIELDS),
+                    'formats': ['>i4'] * len(TRACE_HEADER_FIELDS),
+                    'offsets': [int(field) - 1 for field in TRACE_HEADER_FIELDS.values()],
+                    'itemsize': trace_size
+                })
+                headers = np.memmap(filepath, dtype=header_dtype, mode='r', offset=data_offset, shape=(f.tracecount,))
+                return {name: np.array(headers[name], dtype=np.int32) for name in TRACE_HEADER_FIELDS}
+        except Exception as e:
+            print(f"  Warning: Could not map trace headers directly: {e}")
+        
+        # Bulk header reads through segyio: one C-level pass per field
+        return {name: f.attributes(field)[:] for name, field in TRACE_HEADER_FIELDS.items()}
+    
+    def read_regular_cube(self, filepath, unique_inlines, unique_xlines):
+        """Read the whole cube with segyio.tools.cube when the file has a regular geometry"""
+        try:
+            with segyio.open(filepath) as f:
+                if len(f.offsets) != 1:
+                    return None
+                f.mmap()
+                cube = segyio.tools.cube(f)
+                ilines = np.asarray(f.ilines)
+                xlines = np.asarray(f.xlines)
+                if f.sorting == segyio.TraceSortingFormat.CROSSLINE_SORTING:
+                    cube = cube.transpose(1, 0, 2)
+        except Exception as e:
+            print(f"  Irregular geometry ({e}), assembling cube from trace headers")
+            return None
+        
+        if not (np.array_equal(np.sort(ilines), unique_inlines) and np.array_equal(np.sort(xlines), unique_xlines)):
+            return None
+        
+        # segyio lists line numbers in file order; the cube is indexed by ascending line number
+        if np.any(np.diff(ilines) < 0):
+            cube = cube[np.argsort(ilines)]
+        if np.any(np.diff(xlines) < 0):
+            cube = cube[:, np.argsort(xlines)]
+        
+        cube = np.ascontiguousarray(cube, dtype=np.float32)
+        np.nan_to_num(cube, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        print("  Regular geometry, read cube with segyio.tools.cube")
+        return cube
+    
     def calculate_survey_geometry(self, inlines, xlines, x_coords, y_coords, unique_inlines, unique_xlines):
         """Calculate survey geometry and orientation more robustly."""
         try:
-            # Create a dictionary for quick lookup of coordinates
-            coord_map = {(il, xl): (x, y) for il, xl, x, y in zip(inlines, xlines, x_coords, y_coords) if x != 0 and y != 0}
+            valid = (x_coords != 0) & (y_coords != 0)
+            located = np.unique(np.column_stack((inlines[valid], xlines[valid])), axis=0)
 
-            if len(coord_map) < 4:
+            if len(located) < 4:
                 print("  Warning: Insufficient coordinate data for geometry calculation.")
                 return {'inline_azimuth': 0.0, 'xline_azimuth': 90.0, 'has_coordinates': False}
 
-            min_il, max_il = min(unique_inlines), max(unique_inlines)
-            min_xl, max_xl = min(unique_xlines), max(unique_xlines)
+            # unique_* are sorted, so the survey edges are their first and last entries
+            min_il, max_il = unique_inlines[0], unique_inlines[-1]
+            min_xl, max_xl = unique_xlines[0], unique_xlines[-1]
+
+            # Every lookup below lies on an edge inline or xline, so only those traces go into the dictionary
+            on_edge = valid & (np.isin(inlines, (min_il, max_il)) | np.isin(xlines, (min_xl, max_xl)))
+            coord_map = {
+                (il, xl): (x, y)
+                for il, xl, x, y in zip(inlines[on_edge].tolist(), xlines[on_edge].tolist(),
+                                        x_coords[on_edge].tolist(), y_coords[on_edge].tolist())
+            }
 
             # --- Get points for INLINE azimuth calculation ---
             # Try to find points along the first crossline
@@ -352,17 +537,6 @@ class SeismicCubeProcessor:
             
             print(f"✓ Metadata saved to MongoDB")
             print(f"  Cube ID: {self.cube_id}")
-            
-            # Verify the document was saved
-            verify = cubes_collection.find_one({'_id': result.inserted_id})
-            if verify:
-                print(f"✓ Document verified in database")
-            else:
-                print(f"✗ Warning: Document not found after insert")
-            
-            # Count total documents
-            total_docs = cubes_collection.count_documents({})
-            print(f"  Total documents in collection: {total_docs}")
             print(f"{'='*60}\n")
             
             return self.cube_id
@@ -388,6 +562,70 @@ class SeismicCubeProcessor:
             print(f"Error loading from MongoDB: {str(e)}")
             return None
     
+    def save_cube_to_store(self):
+        """Persist the cube as an uncompressed .npy file and record its location in MongoDB"""
+        if not self.cube_id or cubes_collection is None:
+            return None
+        
+        try:
+            # Seismic float32 barely compresses, and a raw .npy can be memory-mapped on reload
+            cube_uri = os.path.join(CUBE_STORE_FOLDER, f"{self.cube_id}.npy")
+            coords_uri = os.path.join(CUBE_STORE_FOLDER, f"{self.cube_id}_coords.npz")
+            print(f"Saving cube to {cube_uri}...")
+            np.save(cube_uri, self.data)
+            np.savez(
+                coords_uri,
+                inline_coords=self.inline_coords,
+                xline_coords=self.xline_coords,
+                sample_coords=self.sample_coords
+            )
+            cubes_collection.update_one(
+                {'_id': ObjectId(self.cube_id)},
+                {
+                    '$set': {
+                        'cube_uri': cube_uri,
+                        'coords_uri': coords_uri,
+                        'updated_at': datetime.utcnow()
+                    }
+                }
+            )
+            print(f"✓ Cube saved ({os.path.getsize(cube_uri) / (1024**2):.1f} MB on disk)")
+            return cube_uri
+        except Exception as e:
+            print(f"✗ Error saving cube to store: {str(e)}")
+            traceback.print_exc()
+            return None
+    
+    def load_cube_from_store(self, cube_id):
+        """Restore a previously uploaded cube by memory-mapping its stored .npy file"""
+        if cubes_collection is None:
+            return False
+        
+        try:
+            document = cubes_collection.find_one({'_id': ObjectId(cube_id)})
+            if not document or not document.get('cube_uri'):
+                print(f"✗ No stored cube for {cube_id}")
+                return False
+            
+            print(f"Loading stored cube from {document['cube_uri']}...")
+            # Read-only mmap: pages are read from disk as slices touch them
+            data = np.load(document['cube_uri'], mmap_mode='r')
+            with np.load(document['coords_uri']) as stored:
+                inline_coords = stored['inline_coords']
+                xline_coords = stored['xline_coords']
+                sample_coords = stored['sample_coords']
+            
+            self.publish_cube(data, inline_coords, xline_coords, sample_coords,
+                              document['cube_info']['amplitude_range'], document['cube_info']['geometry'],
+                              document.get('session_id'), cube_id)
+            
+            print(f"✓ Stored cube loaded, shape: {data.shape}")
+            return True
+        except Exception as e:
+            print(f"✗ Error loading stored cube: {str(e)}")
+            traceback.print_exc()
+            return False
+    
     def update_metadata_in_mongodb(self):
         """Update existing cube metadata in MongoDB"""
         if not self.cube_id or cubes_collection is None:
@@ -410,55 +648,117 @@ class SeismicCubeProcessor:
             print(f"Error updating MongoDB: {str(e)}")
             return False
     
-    def get_slice_data(self, slice_type, index):
-        """Get slice data for visualization with proper coordinate mapping"""
-        if self.data is None:
+    def get_slice_layout(self, slice_type, cube, generation):
+        """Get a copy of the given cube generation laid out so that slices of the given type are contiguous"""
+        with self.lock:
+            if self.generation != generation:
+                # Another cube was loaded since this request started; don't copy the old one
+                return cube.transpose(SLICE_LAYOUT_AXES[slice_type])
+            
+            # slice_layouts holds one Future per axis, so concurrent requests wait on a single build
+            pending = self.slice_layouts.get(slice_type)
+            if pending is None:
+                pending = self.slice_layouts[slice_type] = Future()
+                building = True
+            else:
+                building = False
+        
+        if not building:
+            return pending.result()
+        
+        try:
+            print(f"Building {slice_type} slice layout...")
+            layout = np.ascontiguousarray(cube.transpose(SLICE_LAYOUT_AXES[slice_type]))
+        except Exception as e:
+            with self.lock:
+                # Let the next request retry instead of failing on this build forever
+                if self.slice_layouts.get(slice_type) is pending:
+                    del self.slice_layouts[slice_type]
+            pending.set_exception(e)
+            raise
+        
+        pending.set_result(layout)
+        return layout
+    
+    def get_slice_data(self, slice_type, index, max_dim=0, generation=None):
+        """Get slice data for visualization with proper coordinate mapping
+
+        When generation is given, fail instead of reading from a cube loaded after it.
+        """
+        with self.lock:
+            cube = self.data
+            current_generation = self.generation
+            inline_coords = self.inline_coords
+            xline_coords = self.xline_coords
+            sample_coords = self.sample_coords
+        
+        if cube is None:
             print(f"✗ get_slice_data called but self.data is None")
             return None
         
+        if generation is not None and generation != current_generation:
+            print(f"✗ Cube was reloaded while {slice_type}[{index}] was requested")
+            return None
+        
+        # A stored cube is a read-only mmap; slicing it directly only reads the pages the slice touches
+        use_layouts = CACHE_SLICE_LAYOUTS and not isinstance(cube, np.memmap)
+        
         try:
+            # Inline and xline slices are transposed to match visualization orientation
             if slice_type == 'inline':
-                data = self.data[index, :, :]
+                data = cube[index, :, :].T
                 coords = {
-                    'x': self.xline_coords.tolist(),
-                    'y': self.sample_coords.tolist()
+                    'x': xline_coords.tolist(),
+                    'y': sample_coords.tolist()
                 }
                 
             elif slice_type == 'xline':
-                data = self.data[:, index, :]
+                if use_layouts:
+                    data = self.get_slice_layout('xline', cube, current_generation)[index]
+                else:
+                    data = cube[:, index, :].T
                 coords = {
-                    'x': self.inline_coords.tolist(),
-                    'y': self.sample_coords.tolist()
+                    'x': inline_coords.tolist(),
+                    'y': sample_coords.tolist()
                 }
                 
             elif slice_type == 'sample':
-                data = self.data[:, :, index]
+                if use_layouts:
+                    data = self.get_slice_layout('sample', cube, current_generation)[index]
+                else:
+                    data = cube[:, :, index]
                 coords = {
-                    'x': self.inline_coords.tolist(),
-                    'y': self.xline_coords.tolist()
+                    'x': inline_coords.tolist(),
+                    'y': xline_coords.tolist()
                 }
             else:
                 return None
             
-            # Clean the data
-            data = np.array(data)
-            data = np.nan_to_num(data, nan=0.0, posinf=0.0, neginf=0.0)
+            if max_dim > 0:
+                data, row_stride, col_stride = block_mean_downsample(data, max_dim)
+                # Sample slices have inlines along rows; inline and xline slices have samples along rows
+                row_key, col_key = ('x', 'y') if slice_type == 'sample' else ('y', 'x')
+                coords[row_key] = coords[row_key][:data.shape[0] * row_stride:row_stride]
+                coords[col_key] = coords[col_key][:data.shape[1] * col_stride:col_stride]
+            
+            # Make the slice C-contiguous (free for cached layouts) so the reductions and serialization below stream through memory.
+            # No NaN scrub here: every load path already zeroes non-finite samples, and stored cubes are read-only mmaps
+            data = np.ascontiguousarray(data)
             
-            # Transpose for inline and xline to match visualization orientation
-            if slice_type in ['inline', 'xline']:
-                data = data.T
+            # One fused serial pass over the slice; request threads never launch parallel kernels
+            data_min, data_max, data_mean, data_std = (float(v) for v in compute_slice_stats(data))
             
             print(f"✓ Slice data prepared: {slice_type}[{index}], shape: {data.shape}")
-            print(f"  Data range: {np.min(data):.6f} to {np.max(data):.6f}")
+            print(f"  Data range: {data_min:.6f} to {data_max:.6f}")
             
             return {
-                'data': data.tolist(),
+                'data': data,
                 'coordinates': coords,
                 'amplitude_stats': {
-                    'min': float(np.min(data)),
-                    'max': float(np.max(data)),
-                    'mean': float(np.mean(data)),
-                    'std': float(np.std(data))
+                    'min': data_min,
+                    'max': data_max,
+                    'mean': data_mean,
+                    'std': data_std
                 }
             }
             
@@ -469,48 +769,69 @@ class SeismicCubeProcessor:
     
     def get_cube_info(self):
         """Get cube information with improved metadata"""
-        if self.data is None:
-            print("✗ get_cube_info called but self.data is None")
-            return None
-        
-        try:
-            info = {
-                'shape': list(self.data.shape),
-                'inline_range': {
-                    'min': int(self.inline_range.min()),
-                    'max': int(self.inline_range.max()),
-                    'count': len(self.inline_range)
-                },
-                'xline_range': {
-                    'min': int(self.xline_range.min()),
-                    'max': int(self.xline_range.max()),
-                    'count': len(self.xline_range)
-                },
-                'sample_range': {
-                    'min': float(self.sample_range.min()),
-                    'max': float(self.sample_range.max()),
-                    'count': len(self.sample_range)
-                },
-                'amplitude_range': self.amplitude_range,
-                'memory_usage_mb': float(self.data.nbytes / (1024**2)),
-                'geometry': getattr(self, 'geometry', {
-                    'inline_azimuth': 0.0,
-                    'xline_azimuth': 90.0,
-                    'has_coordinates': False
-                })
-            }
-            return info
+        # Hold the lock so the info never mixes fields from two different cubes
+        with self.lock:
+            if self.data is None:
+                print("✗ get_cube_info called but self.data is None")
+                return None
             
-        except Exception as e:
-            print(f"✗ Error getting cube info: {str(e)}")
-            traceback.print_exc()
-            return None
+            try:
+                info = {
+                    'shape': list(self.data.shape),
+                    'inline_range': {
+                        'min': int(self.inline_range.min()),
+                        'max': int(self.inline_range.max()),
+                        'count': len(self.inline_range)
+                    },
+                    'xline_range': {
+                        'min': int(self.xline_range.min()),
+                        'max': int(self.xline_range.max()),
+                        'count': len(self.xline_range)
+                    },
+                    'sample_range': {
+                        'min': float(self.sample_range.min()),
+                        'max': float(self.sample_range.max()),
+                        'count': len(self.sample_range)
+                    },
+                    'amplitude_range': self.amplitude_range,
+                    'memory_usage_mb': float(self.data.nbytes / (1024**2)),
+                    'geometry': self.geometry
+                }
+                return info
+                
+            except Exception as e:
+                print(f"✗ Error getting cube info: {str(e)}")
+                traceback.print_exc()
+                return None
 
 processor = SeismicCubeProcessor()
 
+# Uploads and stored-cube reloads run one at a time off the request thread since they all load into the shared processor
+job_executor = ThreadPoolExecutor(max_workers=1)
+jobs = {}
+jobs_lock = threading.Lock()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def serialize_cube_document(cube):
+    """Convert ObjectId and datetime fields of a cube document to JSON-friendly values"""
+    cube['_id'] = str(cube['_id'])
+    for field in ('created_at', 'updated_at'):
+        if field in cube:
+            cube[field] = cube[field].isoformat()
+    return cube
+
+@functools.lru_cache(maxsize=SLICE_CACHE_SIZE)
+def get_slice_payload(generation, slice_type, index, max_dim=0):
+    """Get a slice as serialized JSON bytes, cached per loaded cube generation"""
+    slice_data = processor.get_slice_data(slice_type, index, max_dim, generation)
+    if slice_data is None:
+        # Raise rather than return None: lru_cache doesn't store exceptions, so a failure isn't cached
+        raise RuntimeError(f'Failed to get {slice_type} slice {index}')
+    # orjson writes the ndarray directly instead of boxing every sample into a Python float
+    return orjson.dumps(slice_data, option=orjson.OPT_SERIALIZE_NUMPY)
+
 def extract_segy_files(zip_path, extract_to):
     """Extract SEGY files from ZIP archive"""
     segy_files = []
@@ -518,8 +839,10 @@ def extract_segy_files(zip_path, extract_to):
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             for file_info in zip_ref.infolist():
                 if file_info.filename.lower().endswith(('.segy', '.sgy')):
-                    zip_ref.extract(file_info, extract_to)
-                    extracted_path = os.path.join(extract_to, file_info.filename)
+                    # Stream each member to disk in large chunks rather than extract()'s small default buffer
+                    extracted_path = os.path.join(extract_to, secure_filename(file_info.filename))
+                    with zip_ref.open(file_info) as src, open(extracted_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, length=ZIP_COPY_BUFFER_SIZE)
                     segy_files.append(extracted_path)
                     print(f"Extracted: {file_info.filename}")
     except Exception as e:
@@ -527,11 +850,103 @@ def extract_segy_files(zip_path, extract_to):
     
     return segy_files
 
+def process_upload(job_id, segy_files, session_id, temp_dir):
+    """Load the first SEGY file and save its metadata, recording the outcome on the job"""
+    update_job(job_id, status='processing')
+    
+    try:
+        first_segy = segy_files[0]
+        print(f"Processing SEGY file: {os.path.basename(first_segy)}")
+        
+        success = processor.load_segy_file(first_segy, session_id)
+        
+        if not success:
+            update_job(job_id, status='failed', error='Failed to process SEGY file')
+            return
+        
+        # Save metadata to MongoDB
+        cube_id = processor.save_metadata_to_mongodb(os.path.basename(first_segy))
+        processor.save_cube_to_store()
+        
+        cube_info = processor.get_cube_info()
+        if not cube_info:
+            update_job(job_id, status='failed', error='Failed to get cube information')
+            return
+        
+        result = {
+            'message': 'Files uploaded and processed successfully',
+            'files': [os.path.basename(f) for f in segy_files],
+            'cube_info': cube_info,
+            'cube_id': cube_id,
+            'session_id': session_id,
+            'mongodb_connected': cubes_collection is not None
+        }
+        update_job(job_id, status='finished', result=result)
+        
+        print(f"\n✓ Upload job {job_id} finished")
+        print(f"  Cube ID: {cube_id}")
+        print(f"  MongoDB Connected: {cubes_collection is not None}")
+        print(f"{'='*60}\n")
+    
+    except Exception as e:
+        print(f"✗ Upload job {job_id} failed: {str(e)}")
+        traceback.print_exc()
+        update_job(job_id, status='failed', error=f'Upload failed: {str(e)}')
+    
+    finally:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def process_stored_cube_load(job_id, cube_id):
+    """Load a stored cube into the processor, recording the outcome on the job"""
+    update_job(job_id, status='processing')
+    
+    try:
+        if not processor.load_cube_from_store(cube_id):
+            update_job(job_id, status='failed', error='Failed to load stored cube')
+            return
+        
+        cube_info = processor.get_cube_info()
+        if not cube_info:
+            update_job(job_id, status='failed', error='Failed to get cube information')
+            return
+        
+        result = {
+            'cube_id': cube_id,
+            'session_id': processor.session_id,
+            'cube_info': cube_info
+        }
+        update_job(job_id, status='finished', result=result)
+    
+    except Exception as e:
+        print(f"✗ Stored cube load job {job_id} failed: {str(e)}")
+        traceback.print_exc()
+        update_job(job_id, status='failed', error=f'Load failed: {str(e)}')
+
+def create_job():
+    """Register a new queued job, dropping jobs that finished more than JOB_RETENTION_SECONDS ago"""
+    job_id = str(ObjectId())
+    now = datetime.utcnow()
+    with jobs_lock:
+        expired = [
+            old_id for old_id, job in jobs.items()
+            if job['status'] in ('finished', 'failed') and (now - job['updated_at']).total_seconds() > JOB_RETENTION_SECONDS
+        ]
+        for old_id in expired:
+            del jobs[old_id]
+        jobs[job_id] = {'status': 'queued', 'created_at': now, 'updated_at': now}
+    return job_id
+
+def update_job(job_id, **fields):
+    """Update the status record of a background upload job"""
+    with jobs_lock:
+        jobs[job_id].update(fields, updated_at=datetime.utcnow())
+
 # API Routes
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload and processing"""
+    """Handle file upload and queue the SEGY processing job"""
     print(f"\n{'='*60}")
     print(f"Upload request received")
     print(f"{'='*60}")
@@ -545,18 +960,22 @@ def upload_file():
     
     # Generate session ID
     session_id = str(ObjectId())
-    processor.session_id = session_id
     print(f"Generated session ID: {session_id}")
     
     uploaded_files = []
     segy_files = []
     temp_dir = tempfile.mkdtemp()
+    job_queued = False
+    
+    # The job reads these files after waiting in the queue, so a later upload with the same filename must not overwrite them
+    session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
+    os.makedirs(session_folder, exist_ok=True)
     
     try:
         for file in files:
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                filepath = os.path.join(session_folder, filename)
                 file.save(filepath)
                 uploaded_files.append(filepath)
                 print(f"Saved file: {filename}")
@@ -570,35 +989,19 @@ def upload_file():
         if not segy_files:
             return jsonify({'error': 'No SEGY files found in uploaded files'}), 400
         
-        first_segy = segy_files[0]
-        print(f"Processing SEGY file: {os.path.basename(first_segy)}")
+        # Loading can take minutes on large cubes, so hand it to the worker and return right away
+        job_id = create_job()
+        job_executor.submit(process_upload, job_id, segy_files, session_id, temp_dir)
+        job_queued = True
         
-        success = processor.load_segy_file(first_segy)
+        print(f"✓ Upload queued as job {job_id}")
+        print(f"{'='*60}\n")
         
-        if success:
-            # Save metadata to MongoDB
-            cube_id = processor.save_metadata_to_mongodb(os.path.basename(first_segy))
-            
-            cube_info = processor.get_cube_info()
-            if cube_info:
-                response_data = {
-                    'message': 'Files uploaded and processed successfully',
-                    'files': [os.path.basename(f) for f in segy_files],
-                    'cube_info': cube_info,
-                    'cube_id': cube_id,
-                    'session_id': session_id,
-                    'mongodb_connected': cubes_collection is not None
-                }
-                print(f"\n✓ Upload successful")
-                print(f"  Cube ID: {cube_id}")
-                print(f"  MongoDB Connected: {cubes_collection is not None}")
-                print(f"{'='*60}\n")
-                
-                return jsonify(response_data)
-            else:
-                return jsonify({'error': 'Failed to get cube information'}), 500
-        else:
-            return jsonify({'error': 'Failed to process SEGY file'}), 500
+        return jsonify({
+            'message': 'Files uploaded, processing started',
+            'job_id': job_id,
+            'session_id': session_id
+        }), 202
     
     except Exception as e:
         print(f"✗ Upload error: {str(e)}")
@@ -606,9 +1009,24 @@ def upload_file():
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
     
     finally:
-        if os.path.exists(temp_dir):
+        # Once queued, the job owns the extracted files and cleans them up itself
+        if not job_queued and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
 
+@app.route('/api/job/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of an upload job"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        job = dict(job)
+    
+    job['job_id'] = job_id
+    job['created_at'] = job['created_at'].isoformat()
+    job['updated_at'] = job['updated_at'].isoformat()
+    return jsonify(job)
+
 @app.route('/api/cube-info', methods=['GET'])
 def get_cube_info():
     """Get current cube information"""
@@ -624,22 +1042,33 @@ def get_slice(slice_type, index):
     if slice_type not in ['inline', 'xline', 'sample']:
         return jsonify({'error': 'Invalid slice type. Must be inline, xline, or sample'}), 400
     
-    if processor.data is None:
+    # Take the cube and its generation together so bounds checks and the cache key agree
+    with processor.lock:
+        cube = processor.data
+        generation = processor.generation
+    
+    if cube is None:
         return jsonify({'error': 'No cube data loaded'}), 400
     
+    # Optional cap on the returned slice size, for viewports smaller than the slice
+    max_dim = request.args.get('max_dim', 0, type=int)
+    if max_dim < 0:
+        return jsonify({'error': 'max_dim must be a non-negative integer'}), 400
+    
     max_indices = {
-        'inline': processor.data.shape[0] - 1,
-        'xline': processor.data.shape[1] - 1,
-        'sample': processor.data.shape[2] - 1
+        'inline': cube.shape[0] - 1,
+        'xline': cube.shape[1] - 1,
+        'sample': cube.shape[2] - 1
     }
     
     if index < 0 or index > max_indices[slice_type]:
         return jsonify({'error': f'Index {index} out of bounds for {slice_type} (max: {max_indices[slice_type]})'}), 400
     
-    slice_data = processor.get_slice_data(slice_type, index)
-    if slice_data:
-        return jsonify(slice_data)
-    else:
+    try:
+        payload = get_slice_payload(generation, slice_type, index, max_dim)
+        return Response(payload, mimetype='application/json')
+    except Exception as e:
+        print(f"✗ Error serving slice: {str(e)}")
         return jsonify({'error': 'Failed to get slice data'}), 500
 
 @app.route('/api/cubes', methods=['GET'])
@@ -649,14 +1078,9 @@ def list_cubes():
         return jsonify({'error': 'MongoDB not connected', 'cubes': []}), 200
     
     try:
-        cubes = list(cubes_collection.find().sort('created_at', -1).limit(50))
-        
-        for cube in cubes:
-            cube['_id'] = str(cube['_id'])
-            if 'created_at' in cube:
-                cube['created_at'] = cube['created_at'].isoformat()
-            if 'updated_at' in cube:
-                cube['updated_at'] = cube['updated_at'].isoformat()
+        # The list view only needs the summary fields, so leave the bulky cube_info on the server
+        cursor = cubes_collection.find({}, projection=CUBE_LIST_PROJECTION).sort('created_at', -1).limit(50)
+        cubes = [serialize_cube_document(cube) for cube in cursor]
         
         print(f"Listed {len(cubes)} cubes from MongoDB")
         return jsonify({'cubes': cubes, 'count': len(cubes)})
@@ -674,26 +1098,44 @@ def get_cube_by_id(cube_id):
     try:
         cube = cubes_collection.find_one({'_id': ObjectId(cube_id)})
         if cube:
-            cube['_id'] = str(cube['_id'])
-            if 'created_at' in cube:
-                cube['created_at'] = cube['created_at'].isoformat()
-            if 'updated_at' in cube:
-                cube['updated_at'] = cube['updated_at'].isoformat()
-            return jsonify(cube)
+            return jsonify(serialize_cube_document(cube))
         else:
             return jsonify({'error': 'Cube not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cube/<cube_id>/load', methods=['POST'])
+def load_stored_cube(cube_id):
+    """Queue loading a previously processed cube back into the viewer"""
+    if cubes_collection is None:
+        return jsonify({'error': 'MongoDB not connected'}), 503
+    
+    try:
+        cube = cubes_collection.find_one({'_id': ObjectId(cube_id)}, projection={'cube_uri': 1})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if not cube or not cube.get('cube_uri'):
+        return jsonify({'error': 'Stored cube not found'}), 404
+    
+    # Same worker as uploads, so a reload never runs alongside another load of the shared processor
+    job_id = create_job()
+    job_executor.submit(process_stored_cube_load, job_id, cube_id)
+    
+    return jsonify({'message': 'Loading stored cube', 'job_id': job_id, 'cube_id': cube_id}), 202
+
 @app.route('/api/cube/<cube_id>', methods=['DELETE'])
 def delete_cube(cube_id):
-    """Delete cube metadata from MongoDB"""
+    """Delete cube metadata from MongoDB along with its stored cube file"""
     if cubes_collection is None:
         return jsonify({'error': 'MongoDB not connected'}), 503
     
     try:
-        result = cubes_collection.delete_one({'_id': ObjectId(cube_id)})
-        if result.deleted_count > 0:
+        cube = cubes_collection.find_one_and_delete({'_id': ObjectId(cube_id)}, projection={'cube_uri': 1, 'coords_uri': 1})
+        if cube:
+            for uri in (cube.get('cube_uri'), cube.get('coords_uri')):
+                if uri and os.path.exists(uri):
+                    os.remove(uri)
             print(f"✓ Deleted cube: {cube_id}")
             return jsonify({'message': 'Cube deleted successfully'})
         else:
@@ -701,6 +1143,17 @@ def delete_cube(cube_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get MongoDB collection statistics"""
+    if cubes_collection is None:
+        return jsonify({'error': 'MongoDB not connected'}), 503
+    
+    try:
+        return jsonify({'total_cubes': cubes_collection.estimated_document_count()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -746,11 +1199,14 @@ if __name__ == '__main__':
     
     print("\nAPI endpoints:")
     print("  POST   /api/upload - Upload SEGY files")
+    print("  GET    /api/job/<id> - Get upload job status")
     print("  GET    /api/cube-info - Get current cube information")
     print("  GET    /api/slice/<type>/<index> - Get slice data")
     print("  GET    /api/cubes - List all stored cubes")
     print("  GET    /api/cube/<id> - Get cube by ID")
+    print("  POST   /api/cube/<id>/load - Queue loading a stored cube")
     print("  DELETE /api/cube/<id> - Delete cube")
+    print("  GET    /api/stats - MongoDB collection statistics")
     print("  GET    /api/health - Health check")
     print("=" * 60 + "\n")
     